@@ -12,29 +12,60 @@ import re
 import math
 import json
 import random # Added for jitter in backoff & discovery
+import hashlib # Added for content-addressed caption/summary cache keys
+import sqlite3 # Added for the on-disk embedding cache
 import concurrent.futures # Added for indexing
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 import argparse # Added for command-line arguments
+import functools # Added for caching the NVENC probe
+import threading # Added for overlapping chunk verification with splitting
+import contextlib # Added for profiling spans
+import contextvars # Added for profiling spans
+import tempfile # Added for unique temp files in atomic JSON writes
+from collections import defaultdict
 from urllib.parse import urlparse, urlunparse # Added for URL normalization
 
 # Third-Party Imports
 import yt_dlp
+import numpy as np
 from scenedetect import open_video, SceneManager, ContentDetector
 from scenedetect.video_splitter import split_video_ffmpeg, DEFAULT_FFMPEG_ARGS
 from scenedetect.frame_timecode import FrameTimecode
-from dotenv import load_dotenv, set_key # Added set_key
+from dotenv import load_dotenv, find_dotenv, set_key # Added set_key
 from google import genai
 from google.genai import types as google_types
-from google.api_core import exceptions as google_exceptions
-from openai import OpenAI
-from httpx import WriteTimeout, ReadTimeout # Added ReadTimeout
+from google.genai import errors as genai_errors
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError, BadRequestError
+import httpx # Added for the Gemini connection pool
 from pinecone.grpc import PineconeGRPC as Pinecone # Added for indexing
 from pinecone import ServerlessSpec # Added for indexing
 
+# Optional: C-accelerated JSON for the metadata files (falls back to the stdlib json module)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: faster asyncio event loop (Linux/macOS) for the async captioning stage
+# (used per call via _run_async rather than installed as the global event loop policy)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Optional: GPU (NVDEC) decoding for scene detection via torchcodec
+try:
+    import torch
+    from torchcodec.decoders import VideoDecoder
+except (ImportError, RuntimeError, OSError): # torchcodec raises RuntimeError/OSError if its FFmpeg libraries are missing or mismatched
+    torch = None
+    VideoDecoder = None
+
 # loading environment variables
-load_dotenv() # Looks for '.env' in current or parent directories by default
+# Resolved once so initialize_clients() can persist a discovered PINECONE_INDEX_HOST to the same file
+dotenv_path = Path(find_dotenv() or Path(__file__).resolve().parent / ".env")
+load_dotenv(dotenv_path) # Looks for '.env' in current or parent directories by default
 
 ms_token = os.environ.get("ms_token", None) # For TikTokApi; currently not used since we're using headless browser
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -51,25 +82,448 @@ if not PINECONE_API_KEY:
     print("FATAL ERROR: PINECONE_API_KEY not found in environment or .env.local")
 # PINECONE_INDEX_HOST is checked within initialize_clients
 
+# Configuration for download stage
+DOWNLOAD_MAX_CONCURRENT = 4 # Max concurrent yt-dlp downloads in download_batch
+DOWNLOAD_CONCURRENT_FRAGMENTS = 8 # Parallel HLS/DASH fragment downloads per video
+DOWNLOAD_HTTP_CHUNK_SIZE = 10 * 1024 * 1024 # 10MB ranged requests for non-fragmented streams
+
+# Configuration for chunking stage
+SCENE_DETECT_DOWNSCALE_HEIGHT = 240 # ContentDetector doesn't need native resolution
+SCENE_DETECT_GPU_BATCH_SIZE = 64 # Frames decoded per batch on the GPU
+SCENE_DETECT_GPU_RESIZE_BYTES = 256 * 1024 * 1024 # Cap on float32 frame memory per resize call (~10 frames at 1080p, 2 at 4K)
+
 # Configuration for captioning stage
 CAPTION_MODEL_NAME = "gemini-2.5-pro-preview-03-25"
 CAPTION_MAX_WORKERS = 8 # Max concurrent Gemini API calls
 CAPTION_MAX_RETRIES = 5
 CAPTION_INITIAL_BACKOFF_SECONDS = 2
+# google-genai raises APIError subclasses carrying the HTTP status; only timeouts, rate limits and 5xx are retried
+GEMINI_RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+RETRY_MAX_BACKOFF_SECONDS = 60 # Ceiling for any single exponential backoff wait
+RETRY_JITTER_SECONDS = 1.0 # Random jitter added to each backoff wait
+FILE_POLL_INITIAL_INTERVAL_SECONDS = 0.25 # First wait before re-checking an uploaded file's state
+FILE_POLL_MAX_INTERVAL_SECONDS = 2
+GEMINI_MAX_CONNECTIONS = 200 # Connection pool shared by all async Gemini calls in Stage 3
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = 100
+GEMINI_REQUESTS_PER_MINUTE = 600 # Gemini quota; caption requests are paced to this rate to avoid 429 backoffs
 SUMMARY_MODEL_NAME = "gpt-4o-mini" # For summary/themes
+OPENAI_MAX_RETRIES = 5 # Attempts for summary/themes and embedding calls
+OPENAI_INITIAL_BACKOFF_SECONDS = 1
+OPENAI_MAX_CONNECTIONS = 64 # Pooled HTTP/2 connections for OpenAI calls (summary, embeddings)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 32
+OPENAI_HTTP_TIMEOUT_SECONDS = 60
+# Rate limits, timeouts, connection drops and 5xx are transient; 4xx (bad request, auth) are not
+OPENAI_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+# Bump these when the corresponding prompt changes so stale cached outputs are not reused
+CAPTION_PROMPT_VERSION = "1"
+SUMMARY_PROMPT_VERSION = "1"
+
+# Fixed parts of the summary/themes prompts; the concatenated captions go between prefix and suffix
+_SUMMARY_PROMPT_PREFIX = """
+**Objective:** Generate a concise, accurate, and informative overall summary of a video based on a sequence of timed text captions derived from its chunks.
+
+**Input:** You will receive a single block of text containing concatenated captions. Each caption describes a sequential segment of the video and is preceded by its start and end timestamps (e.g., "[00:12.345 - 00:16.789]").
+
+**Task:**
+1. Read through the entire sequence of timed captions to understand the video's content flow.
+2. Synthesize this information into a single, coherent paragraph summarizing the **entire video**.
+3. Focus on identifying:
+    * The main subject(s) or characters.
+    * The primary actions, events, or topics discussed.
+    * The overall narrative arc or progression (beginning, middle, end developments).
+    * The central theme, message, or purpose of the video, if discernible.
+4. The summary must be **concise** and capture the most crucial information.
+5. **Ignore minor repetitive details** mentioned across consecutive captions if they don't represent significant changes or progression. Focus on the essence of what happened.
+6. The final output should be **only the summary paragraph**, suitable for providing high-level context when answering user questions about the video. Do not include preamble or explanation.
+
+**Input Captions:**
+"""
+_SUMMARY_PROMPT_SUFFIX = """
+
+**Output Summary:**
+"""
+_THEMES_PROMPT_PREFIX = """
+Based on the following video captions, identify 3-5 key themes or topics covered in the video.
+Return ONLY a comma-separated list of themes/topics, with no numbering, explanations, or preamble.
+
+Example good output: "friendship, betrayal, redemption"
+
+Captions:
+"""
+_THEMES_PROMPT_SUFFIX = """
+"""
+
+# Configuration for the on-disk caption/summary cache
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+CACHE_HASH_READ_SIZE = 1024 * 1024 # Read chunk files in 1 MiB blocks when hashing
+EMBEDDING_CACHE_PATH = CACHE_DIR / "embeddings.sqlite3"
+EMBEDDING_CACHE_QUERY_BATCH_SIZE = 500 # Keys per SELECT ... IN (...) (stays under SQLite's bound-parameter limit)
 
 # Configuration for indexing stage (from index_and_retrieve.py)
 INDEX_NAME = "video-captions-index"
 EMBED_MODEL_NAME = "text-embedding-ada-002"
 EMBED_DIM = 1536
-INDEXING_BATCH_SIZE = 100
-INDEXING_MAX_EMBEDDING_WORKERS = 8 # Max concurrent OpenAI embedding calls
+INDEXING_BATCH_SIZE = 100 # Max vectors per upsert request
+INDEXING_MAX_REQUEST_BYTES = 2 * 1024 * 1024 # Pinecone upsert payload limit (2 MB)
+INDEXING_BYTES_PER_VALUE = 4 # PineconeGRPC sends values as packed protobuf float32
+INDEXING_RECORD_OVERHEAD_BYTES = 64 # Protobuf field tags/lengths per record, plus Struct encoding of the metadata
+EMBED_BATCH_SIZE = 256 # Captions per OpenAI embeddings request (API accepts up to 2048 inputs)
+INDEXING_MAX_EMBEDDING_WORKERS = 4 # Max concurrent OpenAI embedding batch calls
+INDEXING_FETCH_BATCH_SIZE = 1000 # Pinecone fetch limit (IDs per request)
+INDEXING_MAX_FETCH_WORKERS = 8 # Max concurrent Pinecone fetch calls
+INDEXING_MAX_UPSERT_WORKERS = 8 # Max concurrent Pinecone upsert batches
+INDEXING_DONE_STATUSES = ("COMPLETED", "SKIPPED_NO_CAPTIONS", "SKIPPED_ALREADY_INDEXED") # indexing_status values that need no rerun
 
 # Global API Clients (initialized later)
 openai_client = None
 pc = None
 pinecone_index = None
+_clients_init_lock = threading.Lock() # Guards initialize_clients() so concurrent callers do the setup once
+_clients_initialized = False
+
+# Profiling: set PIPELINE_PROFILE=1 to record per-phase spans and print percentiles at the end of a run
+PIPELINE_PROFILE = os.environ.get("PIPELINE_PROFILE") == "1"
+_SPANS = contextvars.ContextVar("_SPANS", default=None) # span name -> list of durations (ns), or None when off
+
+
+# --- Shared Helpers ---
+
+@contextlib.contextmanager
+def _span(name):
+    """
+    Internal helper: Records the duration (ns) of the wrapped block under `name`.
+
+    Spans go into the dict held by the _SPANS context variable; when profiling is
+    off (_SPANS is None) this is a no-op.
+    """
+    spans = _SPANS.get()
+    if spans is None:
+        yield
+        return
+    start_ns = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        spans[name].append(time.perf_counter_ns() - start_ns)
+
+def _report_spans(spans):
+    """Internal helper: Prints count and p50/p90/max (ms) for each recorded span."""
+    print("\n--- Profile Spans (ms) ---")
+    for name, durations in sorted(spans.items()):
+        ordered = sorted(durations)
+        count = len(ordered)
+        p50 = ordered[count // 2] / 1e6
+        p90 = ordered[min(count - 1, int(count * 0.9))] / 1e6
+        print(f"  {name}: n={count} p50={p50:.1f} p90={p90:.1f} max={ordered[-1] / 1e6:.1f}")
+
+def _read_json(path):
+    """Internal helper: Loads a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _json_size(obj):
+    """Internal helper: Returns the serialized JSON size of `obj`, using orjson when it is installed."""
+    if orjson is not None:
+        return len(orjson.dumps(obj))
+    return len(json.dumps(obj))
+
+def _atomic_write_json(path, data, ensure_ascii=True):
+    """
+    Internal helper: Writes `data` as indented JSON to `path` atomically.
+
+    The JSON is written to a temp file in the same directory and moved into place
+    with os.replace, so readers never see a partially written metadata file.
+    Uses orjson when installed (always UTF-8 output, so `ensure_ascii` only
+    applies to the stdlib fallback).
+    """
+    # A unique temp name per call, so concurrent writers of the same path don't clobber each other's temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        if orjson is not None:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=ensure_ascii)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Don't leave a stray temp file behind if serialization or the move fails
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+def _backoff_seconds(attempt, base_seconds):
+    """Internal helper: Exponential backoff with jitter for a 0-based attempt, capped at RETRY_MAX_BACKOFF_SECONDS."""
+    return min(RETRY_MAX_BACKOFF_SECONDS, base_seconds * (2 ** attempt)) + random.uniform(0, RETRY_JITTER_SECONDS)
+
+def _retry_after_seconds(error):
+    """Internal helper: Returns the Retry-After delay (seconds) from an API error's HTTP response, or None."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    retry_after = headers.get('retry-after') if headers else None
+    try:
+        return min(RETRY_MAX_BACKOFF_SECONDS, float(retry_after)) if retry_after else None
+    except (TypeError, ValueError): # HTTP-date form, not worth parsing here
+        return None
+
+def _run_async(coro):
+    """Internal helper: Runs a coroutine to completion on a fresh event loop, using uvloop when installed."""
+    if uvloop is not None:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+def _make_openai_http_client(client_cls):
+    """Internal helper: Builds a pooled HTTP/2 client (httpx.Client or httpx.AsyncClient) for the OpenAI SDK."""
+    return client_cls(
+        http2=True,
+        timeout=OPENAI_HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+
+def _call_openai_with_retries(request_fn, *args, **kwargs):
+    """
+    Internal helper: Calls an OpenAI client method, retrying transient errors with backoff.
+
+    Errors in OPENAI_RETRYABLE_ERRORS are retried up to OPENAI_MAX_RETRIES attempts;
+    anything else (and the last transient error) is raised to the caller.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES):
+        try:
+            return request_fn(*args, **kwargs)
+        except OPENAI_RETRYABLE_ERRORS as e:
+            if attempt == OPENAI_MAX_RETRIES - 1:
+                raise
+            backoff_time = _backoff_seconds(attempt, OPENAI_INITIAL_BACKOFF_SECONDS)
+            print(f"      Retryable OpenAI error ({type(e).__name__}) on attempt {attempt + 1}/{OPENAI_MAX_RETRIES}. Retrying after {backoff_time:.2f}s...")
+            time.sleep(backoff_time)
+
+async def _call_openai_with_retries_async(request_fn, *args, **kwargs):
+    """Internal helper: Async counterpart of _call_openai_with_retries for AsyncOpenAI client methods."""
+    for attempt in range(OPENAI_MAX_RETRIES):
+        try:
+            return await request_fn(*args, **kwargs)
+        except OPENAI_RETRYABLE_ERRORS as e:
+            if attempt == OPENAI_MAX_RETRIES - 1:
+                raise
+            backoff_time = _backoff_seconds(attempt, OPENAI_INITIAL_BACKOFF_SECONDS)
+            print(f"      Retryable OpenAI error ({type(e).__name__}) on attempt {attempt + 1}/{OPENAI_MAX_RETRIES}. Retrying after {backoff_time:.2f}s...")
+            await asyncio.sleep(backoff_time)
+
+def _sha256_file(path):
+    """Internal helper: Returns the sha256 hex digest of a file, read in CACHE_HASH_READ_SIZE blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CACHE_HASH_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=4096)
+def _sha256_file_memo(path_str, size, mtime_ns):
+    """Internal helper: _sha256_file memoized on (path, size, mtime) so unchanged files are hashed once per process."""
+    return _sha256_file(path_str)
+
+def _chunk_sha256(path):
+    """Internal helper: Returns the (memoized) sha256 hex digest of a chunk file."""
+    stat_result = os.stat(path)
+    return _sha256_file_memo(str(path), stat_result.st_size, stat_result.st_mtime_ns)
+
+class CaptionCache:
+    """
+    Content-addressed on-disk cache for generated text (one JSON blob per key).
+
+    Keys are sha256 digests of everything that determines the output (input content,
+    model name, prompt version), so reruns skip API calls for unchanged inputs.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def make_key(*parts):
+        """Builds a cache key from the given string parts."""
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached dict for `key`, or None on a miss or unreadable entry."""
+        try:
+            return _read_json(self.cache_dir / f"{key}.json")
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"      Warning: Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def put(self, key, value):
+        """Stores `value` (a JSON-serializable dict) under `key`; failures are logged, not raised."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            _atomic_write_json(self.cache_dir / f"{key}.json", value, ensure_ascii=False)
+        except OSError as e:
+            print(f"      Warning: Could not write cache entry {key}: {e}")
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache backed by a single SQLite table.
+
+    Keys are sha256 digests of (model name, caption text), so identical captions are
+    embedded once across runs and videos. Vectors are stored as float16 blobs (half
+    the size of float32, with negligible effect on cosine similarity). Captions the
+    API permanently rejected are recorded as tombstones so reruns do not retry them.
+    Lookups and inserts are batched; failures are logged, not raised.
+    """
+
+    # The table name records the storage dtype, so rows written in another dtype are never misread
+    TABLE_NAME = "embeddings_f16"
+    STORAGE_DTYPE = np.float16
+    TOMBSTONE_TABLE_NAME = "embedding_rejections"
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+
+    @staticmethod
+    def make_key(model_name, text):
+        """Builds a cache key for `text` embedded with `model_name`."""
+        return CaptionCache.make_key(model_name, text)
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (hash TEXT PRIMARY KEY, model TEXT, vector BLOB)")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TOMBSTONE_TABLE_NAME} (hash TEXT PRIMARY KEY, model TEXT, error TEXT)")
+        return conn
+
+    def _select_many(self, table_name, column, keys):
+        """Yields (key, column value) rows for `keys`, querying in batches."""
+        with contextlib.closing(self._connect()) as conn:
+            for i in range(0, len(keys), EMBEDDING_CACHE_QUERY_BATCH_SIZE):
+                key_batch = keys[i:i + EMBEDDING_CACHE_QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(key_batch))
+                yield from conn.execute(f"SELECT hash, {column} FROM {table_name} WHERE hash IN ({placeholders})", key_batch)
+
+    def get_many(self, keys):
+        """Returns {key: vector} for every key found in the cache."""
+        hits = {}
+        if not keys:
+            return hits
+        try:
+            hits.update(
+                (key, np.frombuffer(blob, dtype=self.STORAGE_DTYPE).tolist())
+                for key, blob in self._select_many(self.TABLE_NAME, "vector", keys)
+            )
+        except sqlite3.Error as e:
+            print(f"      Warning: Could not read embedding cache {self.db_path}: {e}")
+        return hits
+
+    def get_rejected(self, keys):
+        """Returns {key: error message} for every key with a tombstone."""
+        rejected = {}
+        if not keys:
+            return rejected
+        try:
+            rejected.update(self._select_many(self.TOMBSTONE_TABLE_NAME, "error", keys))
+        except sqlite3.Error as e:
+            print(f"      Warning: Could not read embedding cache {self.db_path}: {e}")
+        return rejected
+
+    def put_rejected(self, model_name, items):
+        """Records (key, error message) tombstones for `model_name` in one transaction."""
+        rows = [(key, model_name, error) for key, error in items]
+        if not rows:
+            return
+        try:
+            with contextlib.closing(self._connect()) as conn, conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {self.TOMBSTONE_TABLE_NAME} (hash, model, error) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"      Warning: Could not write embedding cache {self.db_path}: {e}")
+
+    def put_many(self, model_name, items):
+        """Stores (key, vector) pairs for `model_name` in one transaction."""
+        rows = [(key, model_name, np.asarray(vector, dtype=self.STORAGE_DTYPE).tobytes()) for key, vector in items]
+        if not rows:
+            return
+        try:
+            with contextlib.closing(self._connect()) as conn, conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {self.TABLE_NAME} (hash, model, vector) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"      Warning: Could not write embedding cache {self.db_path}: {e}")
 
+class StatusWriter:
+    """
+    Buffers status updates to a metadata JSON file and flushes them in one atomic write.
+
+    `set()` and `update()` only change the in-memory dict; the file is written by
+    `checkpoint()`, and only if something changed since the last write.
+    """
+
+    def __init__(self, json_path, data, status_key, ensure_ascii=True):
+        self.json_path = json_path
+        self.data = data
+        self.status_key = status_key
+        self.ensure_ascii = ensure_ascii
+        self._dirty = False
+
+    def set(self, status, **fields):
+        """Records a new status value (and any fields that go with it) in memory."""
+        self.data[self.status_key] = status
+        self.update(**fields)
+
+    def update(self, **fields):
+        """Records other top-level fields in memory without changing the status."""
+        self.data.update(fields)
+        self._dirty = True
+
+    def checkpoint(self):
+        """
+        Writes the buffered data to disk if it changed; failures are logged, not raised.
+
+        Returns:
+            bool: False if the write failed, True otherwise (including when nothing changed).
+        """
+        if not self._dirty:
+            return True
+        try:
+            _atomic_write_json(self.json_path, self.data, ensure_ascii=self.ensure_ascii)
+            self._dirty = False
+            return True
+        except Exception as e:
+            print(f"  Warning: Failed to update JSON status ({self.status_key}={self.data.get(self.status_key)}): {e}")
+            return False
+
+class AsyncTokenBucket:
+    """
+    Token-bucket rate limiter shared by coroutines on one event loop.
+
+    Tokens refill at `rate` per second up to `capacity`; `acquire()` waits until a
+    token is available, so bursts never exceed `capacity` requests.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits for and consumes one token (waiters are served in arrival order)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+caption_cache = CaptionCache(CACHE_DIR / "captions")
+summary_cache = CaptionCache(CACHE_DIR / "summaries")
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
 
 # --- Stage 1: Video Download ---
 
@@ -140,8 +594,7 @@ def download_video_from_url(url, base_download_path):
                 "processing_status": "PROCESSING" # Set initial status
             }
             try:
-                with open(expected_json_path, 'w', encoding='utf-8') as f:
-                    json.dump(initial_json_data, f, indent=2)
+                _atomic_write_json(expected_json_path, initial_json_data)
                 print(f"  Successfully created initial JSON: {expected_json_path}")
             except Exception as e:
                 print(f"  Error creating JSON file {expected_json_path}: {e}")
@@ -164,6 +617,8 @@ def download_video_from_url(url, base_download_path):
         'warning': True, # Show warnings
         'noplaylist': True, # Ensure only the single video is downloaded
         'merge_output_format': 'mp4', # Try to ensure final output is mp4 if merging occurs
+        'concurrent_fragment_downloads': DOWNLOAD_CONCURRENT_FRAGMENTS, # Fetch fragmented streams in parallel
+        'http_chunk_size': DOWNLOAD_HTTP_CHUNK_SIZE,
     }
 
     print(f"  Attempting download via yt-dlp...")
@@ -219,8 +674,7 @@ def download_video_from_url(url, base_download_path):
             "processing_status": "PROCESSING" # Set initial status
         }
         try:
-            with open(expected_json_path, 'w', encoding='utf-8') as f:
-                json.dump(initial_json_data, f, indent=2)
+            _atomic_write_json(expected_json_path, initial_json_data)
             final_json_path = expected_json_path
             print(f"  Successfully created initial JSON: {final_json_path}")
         except Exception as e:
@@ -233,16 +687,40 @@ def download_video_from_url(url, base_download_path):
         print(f"  -> Stage 1 Result: Failed")
         return None, None, None
 
+async def download_batch(urls, base_download_path):
+    """
+    Downloads several videos concurrently by running download_video_from_url in threads.
+
+    At most DOWNLOAD_MAX_CONCURRENT downloads run at once; yt-dlp spends its time in
+    network IO, so threads overlap well here.
+
+    Args:
+        urls (List[str]): The video URLs to download.
+        base_download_path (str): Base directory passed through to download_video_from_url.
+
+    Returns:
+        List[Tuple[str | None, str | None, str | None]]: One download_video_from_url
+        result per URL, in input order.
+    """
+    semaphore = asyncio.Semaphore(DOWNLOAD_MAX_CONCURRENT)
+
+    async def _download_one(url):
+        async with semaphore:
+            return await asyncio.to_thread(download_video_from_url, url, base_download_path)
+
+    return await asyncio.gather(*(_download_one(url) for url in urls))
+
 # --- Stage 2: Video Chunking & Metadata Generation ---
 
+@functools.lru_cache(maxsize=1)
 def is_nvenc_available():
-    """Checks if NVENC hardware acceleration is available via ffmpeg."""
+    """Checks (once per process) if NVENC hardware acceleration is available via ffmpeg."""
     try:
         result = subprocess.run(
             ['ffmpeg', '-hide_banner', '-encoders'],
-            capture_output=True, text=True, check=True
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
         )
-        return 'h264_nvenc' in result.stdout
+        return b'h264_nvenc' in result.stdout
     except FileNotFoundError:
         print("    ffmpeg not found. Cannot check for NVENC.")
         return False
@@ -253,6 +731,133 @@ def is_nvenc_available():
         print(f"    Unexpected error checking for NVENC: {e}")
         return False
 
+@functools.lru_cache(maxsize=1)
+def is_nvdec_available():
+    """Checks (once per process) if NVDEC hardware decoding is available via ffmpeg."""
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-decoders'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        )
+        return b'h264_cuvid' in result.stdout
+    except FileNotFoundError:
+        print("    ffmpeg not found. Cannot check for NVDEC.")
+        return False
+    except subprocess.CalledProcessError as e:
+        print(f"    Error running ffmpeg to check decoders: {e}")
+        return False
+    except Exception as e: # e.g. PermissionError: fall back to CPU decoding
+        print(f"    Unexpected error checking for NVDEC: {e}")
+        return False
+
+def _detect_scenes_nvdec(video_path, detector, frame_rate):
+    """
+    Internal helper: Runs scene detection on frames decoded on the GPU (NVDEC) via torchcodec.
+
+    Frames are resized to SCENE_DETECT_DOWNSCALE_HEIGHT on the GPU (in sub-batches bounded by
+    SCENE_DETECT_GPU_RESIZE_BYTES) before being copied to host memory and fed to
+    `detector.process_frame` directly.
+
+    Args:
+        video_path (str): Path to the input video file.
+        detector: A fresh ContentDetector instance.
+        frame_rate (float): Frame rate of the video, used to build timecodes.
+
+    Returns:
+        List[Tuple[FrameTimecode, FrameTimecode]]: Scene list in the same format as
+        SceneManager.get_scene_list() (empty if no cuts were found).
+    """
+    decoder = VideoDecoder(video_path, device="cuda")
+    num_frames = len(decoder)
+    cut_frames = []
+
+    for batch_start in range(0, num_frames, SCENE_DETECT_GPU_BATCH_SIZE):
+        batch_end = min(batch_start + SCENE_DETECT_GPU_BATCH_SIZE, num_frames)
+        frames = decoder.get_frames_in_range(start=batch_start, stop=batch_end).data # NCHW, RGB, uint8
+        height, width = frames.shape[-2:]
+        if height > SCENE_DETECT_DOWNSCALE_HEIGHT:
+            scaled_width = max(1, round(width * SCENE_DETECT_DOWNSCALE_HEIGHT / height))
+            # Convert to float a few frames at a time: a whole native-resolution batch in float32 can exhaust GPU memory
+            resize_batch_size = max(1, SCENE_DETECT_GPU_RESIZE_BYTES // (frames[0].numel() * 4))
+            frames = torch.cat([
+                torch.nn.functional.interpolate(
+                    sub_batch.float(), size=(SCENE_DETECT_DOWNSCALE_HEIGHT, scaled_width), mode="area"
+                ).to(torch.uint8)
+                for sub_batch in frames.split(resize_batch_size)
+            ])
+        # ContentDetector expects OpenCV-style BGR frames in HWC layout
+        frames = frames.flip(1).permute(0, 2, 3, 1).contiguous().cpu().numpy()
+        for offset, frame_img in enumerate(frames):
+            cut_frames.extend(detector.process_frame(batch_start + offset, frame_img))
+    cut_frames.extend(detector.post_process(num_frames))
+
+    if not cut_frames:
+        return []
+    boundaries = [0] + sorted(set(cut_frames)) + [num_frames]
+    return [
+        (FrameTimecode(timecode=start, fps=frame_rate), FrameTimecode(timecode=end, fps=frame_rate))
+        for start, end in zip(boundaries, boundaries[1:]) if end > start
+    ]
+
+def _split_video_segments(video_path, scene_list, output_dir, video_id, ffmpeg_args, use_hwaccel=False):
+    """
+    Internal helper: Splits the video into all scene chunks with a single ffmpeg pass.
+
+    Uses ffmpeg's segment muxer with `-segment_times` set to the scene boundaries, so the
+    source is decoded once instead of once per scene. Keyframes are forced at each boundary
+    so segments cut exactly on scene starts.
+
+    Args:
+        video_path (str): Path to the input video file.
+        scene_list: List of (start, end) FrameTimecode tuples covering the video.
+        output_dir (str): Directory to write chunk files into.
+        video_id (str): Video identifier used in chunk filenames.
+        ffmpeg_args (str): Encoder arguments (same format as split_video_ffmpeg's arg_override).
+        use_hwaccel (bool): Decode the input with `-hwaccel cuda`.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg exits with a non-zero status.
+    """
+    # Microsecond precision so rounding never moves a boundary past the frame it should start on
+    boundary_times = ",".join(f"{start_tc.get_seconds():.6f}" for start_tc, _ in scene_list[1:])
+    command = ['ffmpeg', '-nostdin', '-y', '-hide_banner', '-loglevel', 'error']
+    if use_hwaccel:
+        command += ['-hwaccel', 'cuda']
+    command += ['-i', video_path]
+    command += ffmpeg_args.split()
+    if boundary_times:
+        command += ['-force_key_frames', boundary_times, '-segment_times', boundary_times]
+        if 'h264_nvenc' in ffmpeg_args:
+            # NVENC emits forced keyframes as non-IDR I-frames unless asked, and the segment muxer needs IDRs
+            command += ['-forced-idr', '1']
+    command += [
+        '-f', 'segment',
+        '-segment_start_number', '1',
+        '-reset_timestamps', '1',
+        os.path.join(output_dir, f"{video_id}-Scene-%03d.mp4")
+    ]
+    # Nothing is read from stdout; with -loglevel error, stderr only carries the (small) error output
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+def _watch_chunk_files(output_dir, stop_event, chunk_file_sizes, poll_interval=0.5):
+    """
+    Internal helper (thread target): Records chunk files whose size is stable between polls.
+
+    Runs while ffmpeg is still writing later chunks. Results are written into
+    `chunk_file_sizes` (filename -> size in bytes); the final verification scan
+    re-stats every chunk, so these entries are progress only, never the verdict.
+    """
+    last_sizes = {}
+    while not stop_event.wait(poll_interval):
+        try:
+            current_sizes = {entry.name: entry.stat().st_size for entry in os.scandir(output_dir) if entry.is_file()}
+        except OSError:
+            continue # Directory briefly unreadable; try again next poll
+        for name, size in current_sizes.items():
+            if size > 0 and last_sizes.get(name) == size:
+                chunk_file_sizes[name] = size
+        last_sizes = current_sizes
+
 def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path, fixed_chunk_duration=4.0):
     """
     Detects scenes or creates fixed-length chunks, saves chunks, and updates
@@ -293,8 +898,7 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
     try:
         # Read existing JSON data
         print(f"  Reading existing metadata from {metadata_json_path}...")
-        with open(metadata_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _read_json(metadata_json_path)
         # Ensure video_id matches
         if data.get("video_id") != video_id:
              print(f"  Error: video_id in JSON ({data.get('video_id')}) does not match provided video_id ({video_id}).")
@@ -318,30 +922,39 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
         print(f"    - Total Duration: {total_duration_seconds:.3f} seconds")
 
         # Configure detector
-        detector = ContentDetector(
-            threshold=27.0, # Default recommended threshold
-            min_scene_len=int(frame_rate * 0.5) # Minimum scene length = 0.5 seconds
-        )
-
-        # Use SceneManager
-        scene_manager = SceneManager()
-        scene_manager.add_detector(detector)
+        detector_kwargs = {
+            "threshold": 27.0, # Default recommended threshold
+            "min_scene_len": int(frame_rate * 0.5) # Minimum scene length = 0.5 seconds
+        }
 
         print("  Detecting scenes (this may take a moment)...")
         detect_start_time = time.time()
-        scene_manager.detect_scenes(video, show_progress=True)
+        scene_list = None
+        if VideoDecoder is not None and torch.cuda.is_available() and is_nvdec_available():
+            print("  Using NVDEC hardware decoding for scene detection.")
+            try:
+                scene_list = _detect_scenes_nvdec(video_path, ContentDetector(**detector_kwargs), frame_rate)
+            except Exception as e:
+                print(f"  NVDEC scene detection failed ({e}). Falling back to CPU decoding.")
+                scene_list = None
+
+        if scene_list is None:
+            # Use SceneManager (OpenCV CPU decode)
+            scene_manager = SceneManager()
+            scene_manager.add_detector(ContentDetector(**detector_kwargs))
+            scene_manager.detect_scenes(video, show_progress=True)
+            scene_list = scene_manager.get_scene_list()
         detect_end_time = time.time()
         print(f"  Scene detection attempt took: {detect_end_time - detect_start_time:.2f} seconds")
 
         detection_method = "Scene Detection"
-        scene_list = scene_manager.get_scene_list()
 
         # --- Fallback Logic ---
         if len(scene_list) <= 1:
             print(f"  Scene detection found {len(scene_list)} scene(s). Falling back to fixed {fixed_chunk_duration}s chunks.")
             detection_method = f"Fixed {fixed_chunk_duration}s Chunking"
             chunk_len_frames = int(fixed_chunk_duration * frame_rate)
-            num_fixed_chunks = math.ceil(duration_frames / chunk_len_frames)
+            num_fixed_chunks = -(-duration_frames // chunk_len_frames) # Integer ceil division
             scene_list = []
             for i in range(num_fixed_chunks):
                 start_frame = i * chunk_len_frames
@@ -364,38 +977,43 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
 
         # --- Prepare JSON Metadata (Update existing data) ---
         num_chunks = len(scene_list)
-        chunks_metadata = []
         # Template for actual files saved by ffmpeg (needs extension)
         output_file_template_ffmpeg = f'{video_id}-Scene-$SCENE_NUMBER.mp4'
 
         print(f"  Preparing metadata for {num_chunks} chunks...")
-        for i, (start_tc, end_tc) in enumerate(scene_list):
-            scene_number = i + 1
-            # chunk_name for JSON metadata (NO extension)
-            chunk_name_metadata = f"{video_id}-Scene-{scene_number:03d}"
-
-            start_seconds = start_tc.get_seconds()
-            end_seconds = end_tc.get_seconds()
-            if end_seconds <= start_seconds:
-                 end_seconds = start_seconds + (1 / frame_rate) # Min 1 frame duration
+        # Compute all chunk times as arrays in one pass rather than per scene
+        start_seconds = np.fromiter((start_tc.get_frames() for start_tc, _ in scene_list), dtype=np.int64, count=num_chunks) / frame_rate
+        end_seconds = np.fromiter((end_tc.get_frames() for _, end_tc in scene_list), dtype=np.int64, count=num_chunks) / frame_rate
+        end_seconds = np.where(end_seconds <= start_seconds, start_seconds + (1 / frame_rate), end_seconds) # Min 1 frame duration
 
-            start_ts_str = f"{int(start_seconds // 60):02}:{start_seconds % 60:06.3f}"
-            end_ts_str = f"{int(end_seconds // 60):02}:{end_seconds % 60:06.3f}"
+        start_ts_strs = np.char.add(np.char.mod("%02d:", start_seconds // 60), np.char.mod("%06.3f", start_seconds % 60))
+        end_ts_strs = np.char.add(np.char.mod("%02d:", end_seconds // 60), np.char.mod("%06.3f", end_seconds % 60))
 
-            normalized_start_time = start_seconds / total_duration_seconds if total_duration_seconds > 0 else 0.0
-            normalized_end_time = end_seconds / total_duration_seconds if total_duration_seconds > 0 else 0.0
-            chunk_duration = end_seconds - start_seconds
+        if total_duration_seconds > 0:
+            normalized_start_times = start_seconds / total_duration_seconds
+            normalized_end_times = end_seconds / total_duration_seconds
+        else:
+            normalized_start_times = np.zeros(num_chunks)
+            normalized_end_times = np.zeros(num_chunks)
+        chunk_durations = end_seconds - start_seconds
 
-            chunks_metadata.append({
-                "chunk_name": chunk_name_metadata, # Use extension-less name for JSON
+        chunks_metadata = [
+            {
+                "chunk_name": f"{video_id}-Scene-{scene_number:03d}", # Use extension-less name for JSON
                 "video_id": video_id, # Use video_id key
                 "start_timestamp": start_ts_str,
                 "end_timestamp": end_ts_str,
                 "chunk_number": scene_number,
+                # Built-in round() on the Python floats: np.round rounds halves to even and can differ in the last digit
                 "normalized_start_time": round(normalized_start_time, 3),
                 "normalized_end_time": round(normalized_end_time, 3),
                 "chunk_duration_seconds": round(chunk_duration, 3)
-            })
+            }
+            for scene_number, start_ts_str, end_ts_str, normalized_start_time, normalized_end_time, chunk_duration in zip(
+                range(1, num_chunks + 1), start_ts_strs.tolist(), end_ts_strs.tolist(),
+                normalized_start_times.tolist(), normalized_end_times.tolist(), chunk_durations.tolist()
+            )
+        ]
 
         # Update the main data dictionary read from the file
         data["num_chunks"] = num_chunks
@@ -407,7 +1025,8 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
         # --- End Prepare JSON Metadata ---
 
         # Determine FFmpeg arguments
-        if is_nvenc_available():
+        use_nvenc = is_nvenc_available()
+        if use_nvenc:
             ffmpeg_args = '-map 0:v:0 -map 0:a? -c:v h264_nvenc'
             print("  Using NVENC hardware acceleration for splitting.")
         else:
@@ -416,15 +1035,34 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
 
         print(f"  Splitting video into {len(scene_list)} chunks using FFmpeg...")
         split_start_time = time.time()
-        # Use the ffmpeg template WITH extension
-        split_video_ffmpeg(
-            video_path,
-            scene_list,
-            output_dir=output_dir,
-            output_file_template=output_file_template_ffmpeg, # Pass template with .mp4
-            arg_override=ffmpeg_args,
-            show_progress=True
+        # Verify chunks in the background as ffmpeg finishes writing them
+        chunk_file_sizes = {}
+        stop_watching = threading.Event()
+        watcher = threading.Thread(
+            target=_watch_chunk_files, args=(output_dir, stop_watching, chunk_file_sizes), daemon=True
         )
+        watcher.start()
+        try:
+            # Single decode pass: one ffmpeg process emits every chunk via the segment muxer
+            _split_video_segments(
+                video_path, scene_list, output_dir, video_id, ffmpeg_args,
+                use_hwaccel=use_nvenc and is_nvdec_available()
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"  Single-pass segment split failed ({e.stderr.strip() if e.stderr else e}). Falling back to per-scene splitting.")
+            chunk_file_sizes.clear() # Sizes seen during the failed pass say nothing about the fallback's output
+            # Use the ffmpeg template WITH extension
+            split_video_ffmpeg(
+                video_path,
+                scene_list,
+                output_dir=output_dir,
+                output_file_template=output_file_template_ffmpeg, # Pass template with .mp4
+                arg_override=ffmpeg_args,
+                show_progress=False # Skip the per-chunk tqdm progress bar
+            )
+        finally:
+            stop_watching.set()
+            watcher.join()
         split_end_time = time.time()
         print(f"  Video splitting took: {split_end_time - split_start_time:.2f} seconds")
 
@@ -432,13 +1070,18 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
         print(f"  Verifying generated chunks...")
         successful_chunks = 0
         failed_chunks = []
+        # One directory scan re-stats every chunk, so the verdict reflects the files as they are now
+        # (the watcher may have missed the last one or recorded a size a later write replaced)
+        chunk_file_sizes.clear()
+        for entry in os.scandir(output_dir):
+            if entry.is_file():
+                chunk_file_sizes[entry.name] = entry.stat().st_size
         for i in range(num_chunks):
             scene_number = i + 1
             # Verify against the filename WITH extension
             expected_filename = f"{video_id}-Scene-{scene_number:03d}.mp4"
-            expected_filepath = os.path.join(output_dir, expected_filename)
 
-            if os.path.exists(expected_filepath) and os.path.getsize(expected_filepath) > 0:
+            if chunk_file_sizes.get(expected_filename, 0) > 0:
                 successful_chunks += 1
             else:
                 failed_chunks.append(expected_filename)
@@ -458,8 +1101,7 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
         if successful_chunks != num_chunks:
              data["chunking_warnings"] = f"Only {successful_chunks}/{num_chunks} chunks verified successfully."
 
-        with open(metadata_json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        _atomic_write_json(metadata_json_path, data)
         print(f"  Successfully updated metadata.")
         print(f"  -> Stage 2 Result: {metadata_json_path}")
         return metadata_json_path
@@ -471,11 +1113,11 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
         traceback.print_exc()
         # Attempt to update JSON with error status - keep simple error message maybe?
         try:
-            with open(metadata_json_path, 'r', encoding='utf-8') as f: data = json.load(f) # Reload just in case
+            data = _read_json(metadata_json_path) # Reload just in case
             # Remove status update here
             # data["processing_status"] = "CHUNKING_FAILED"
             data["error_message"] = f"Chunking failed: {str(e)}" # Store error msg
-            with open(metadata_json_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
+            _atomic_write_json(metadata_json_path, data)
             print(f"  Updated JSON with error message in {metadata_json_path}")
         except Exception as json_e:
              print(f"  Additionally failed to update JSON status after error: {json_e}")
@@ -486,18 +1128,31 @@ def chunk_video_and_generate_metadata(video_path, video_id, metadata_json_path,
 
 # --- Stage 3: Caption Generation & Video Summarization ---
 
-def _process_single_chunk_for_captioning(client, chunk_path: Path):
+async def _process_single_chunk_for_captioning(client, chunk_path: Path, rate_limiter=None):
     """
     Internal helper: Uploads, processes, captions, and deletes a single video chunk with retries.
 
+    Runs on the asyncio event loop using the client's async (`client.aio`) API.
+
     Args:
         client: Initialized Gemini API client.
         chunk_path: Path object for the video chunk file.
+        rate_limiter (AsyncTokenBucket, optional): Acquired before each generate call.
 
     Returns:
         Tuple[Path, str | None]: The original chunk path and the generated caption (or None on failure).
     """
     print(f"    Processing chunk: {chunk_path.name}...")
+
+    # Reuse a previously generated caption for identical chunk content/model/prompt.
+    # The digest is computed once here (streamed in 1 MiB blocks) and shared by every attempt below.
+    chunk_sha256 = await asyncio.to_thread(_chunk_sha256, chunk_path)
+    cache_key = CaptionCache.make_key(chunk_sha256, CAPTION_MODEL_NAME, CAPTION_PROMPT_VERSION)
+    cached = caption_cache.get(cache_key)
+    if cached and cached.get("caption"):
+        print(f"      Using cached caption for {chunk_path.name}.")
+        return chunk_path, cached["caption"]
+
     uploaded_file = None
     last_exception = None
     attempts_made = 0
@@ -507,40 +1162,37 @@ def _process_single_chunk_for_captioning(client, chunk_path: Path):
         uploaded_file = None # Reset for each attempt
         try:
             # --- 1. Upload ---
-            # print(f"      [{attempts_made}/{CAPTION_MAX_RETRIES}] Uploading...")
-            upload_start = time.monotonic()
-            uploaded_file = client.files.upload(file=chunk_path)
-            upload_end = time.monotonic()
-            # print(f"        Upload took {upload_end - upload_start:.2f}s")
+            # Pass the path (not bytes) so the SDK streams the file instead of holding it in memory.
+            # Chunks were just written by Stage 2, so this read is normally served from the page cache
+            with _span("gemini.upload"):
+                uploaded_file = await client.aio.files.upload(file=chunk_path, config={'mime_type': 'video/mp4'})
 
             # --- 2. Wait for Processing ---
-            # print(f"      Waiting for processing...")
-            polling_interval = 2
+            # Small chunks usually turn ACTIVE within a second of upload, so poll quickly
+            # at first and back off towards the old fixed interval for slower files.
+            polling_interval = FILE_POLL_INITIAL_INTERVAL_SECONDS
             max_polling_time = 300
             elapsed_time = 0
-            wait_start = time.monotonic()
-            while uploaded_file.state.name == "PROCESSING":
-                time.sleep(polling_interval)
-                elapsed_time += polling_interval
-                try:
-                     uploaded_file = client.files.get(name=uploaded_file.name)
-                except Exception as get_err: # Catch error during polling specifically
-                     print(f"\n      Polling error getting file state for {uploaded_file.name}: {get_err}")
-                     raise # Re-raise to be caught by the main attempt's exception handler
+            with _span("gemini.poll"):
+                while uploaded_file.state.name == "PROCESSING":
+                    await asyncio.sleep(polling_interval)
+                    elapsed_time += polling_interval
+                    polling_interval = min(polling_interval * 2, FILE_POLL_MAX_INTERVAL_SECONDS)
+                    try:
+                         uploaded_file = await client.aio.files.get(name=uploaded_file.name)
+                    except Exception as get_err: # Catch error during polling specifically
+                         print(f"\n      Polling error getting file state for {uploaded_file.name}: {get_err}")
+                         raise # Re-raise to be caught by the main attempt's exception handler
 
-                if elapsed_time > max_polling_time:
-                    raise TimeoutError(f"File {uploaded_file.name} processing timed out.")
+                    if elapsed_time > max_polling_time:
+                        raise TimeoutError(f"File {uploaded_file.name} processing timed out.")
 
             if uploaded_file.state.name == "FAILED":
                 raise Exception(f"File processing failed state: {uploaded_file.state.name}")
             elif uploaded_file.state.name != "ACTIVE":
                 raise Exception(f"File not ACTIVE. State: {uploaded_file.state.name}")
-            wait_end = time.monotonic()
-            # print(f"        Processing wait took {wait_end - wait_start:.2f}s")
 
             # --- 3. Generate Caption ---
-            # print("      Generating caption...")
-            gen_start = time.monotonic()
             contents = [
                 google_types.Content(
                     role="user", parts=[google_types.Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)]
@@ -570,37 +1222,56 @@ The goal is to produce a rich, detailed narrative description that captures the
             ]
             generate_content_config = google_types.GenerateContentConfig(response_mime_type="text/plain")
 
-            response_chunks = client.models.generate_content_stream(
-                model=CAPTION_MODEL_NAME, contents=contents, config=generate_content_config
-            )
-            caption = "".join(chunk.text for chunk in response_chunks if hasattr(chunk, 'text') and chunk.text is not None)
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            with _span("gemini.generate"):
+                response_chunks = await client.aio.models.generate_content_stream(
+                    model=CAPTION_MODEL_NAME, contents=contents, config=generate_content_config
+                )
+                caption_parts = []
+                async for response_chunk in response_chunks:
+                    text = getattr(response_chunk, 'text', None)
+                    if text:
+                        caption_parts.append(text)
+            caption = "".join(caption_parts)
 
             if not caption:
                 raise ValueError("Caption generation resulted in empty string.") # Treat empty caption as an error
 
-            gen_end = time.monotonic()
-            # print(f"        Caption generation took {gen_end - gen_start:.2f}s")
             # --- SUCCESS --- If we reach here, everything worked in this attempt
             print(f"      Caption generated successfully for {chunk_path.name}.")
+            caption_cache.put(cache_key, {"caption": caption})
             return chunk_path, caption
 
         # --- Exception Handling for the current attempt --- ##
-        except (google_exceptions.RetryError, google_exceptions.DeadlineExceeded,
-                google_exceptions.ServiceUnavailable, google_exceptions.ServerError,
-                google_exceptions.ResourceExhausted, google_exceptions.ClientError,
-                TimeoutError, WriteTimeout, ReadTimeout, KeyError, ValueError) as e:
-            # These are considered potentially retryable errors
+        except (genai_errors.APIError, httpx.TimeoutException, httpx.TransportError, TimeoutError) as e:
             last_exception = e
+            if isinstance(e, genai_errors.APIError) and e.code not in GEMINI_RETRYABLE_STATUS_CODES:
+                # Other 4xx client errors (bad request, auth, not found) won't succeed on retry: fail fast
+                print(f"      Fatal error on attempt {attempts_made} for {chunk_path.name}: {type(e).__name__} - {e}. Not retrying.")
+                break # Exit the loop immediately, failure will be handled after the loop
+            # Transient network/server/quota errors: retry with backoff
             if attempt < CAPTION_MAX_RETRIES - 1: # Adjusted condition for retry
-                 backoff_time = CAPTION_INITIAL_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, 1) # Adjusted exponent and attempt number
+                 # Prefer the server's Retry-After hint (e.g. on 429) over the blind schedule
+                 retry_after = _retry_after_seconds(e)
+                 if retry_after is not None:
+                     backoff_time = retry_after
+                 else:
+                     backoff_time = _backoff_seconds(attempt, CAPTION_INITIAL_BACKOFF_SECONDS)
                  print(f"      Retryable error ({type(e).__name__}) on attempt {attempts_made}/{CAPTION_MAX_RETRIES}. Retrying after {backoff_time:.2f}s...")
-                 time.sleep(backoff_time)
+                 await asyncio.sleep(backoff_time)
                  # No explicit continue needed, loop will proceed to next iteration
             else:
                  # Max retries reached for a retryable error
                  print(f"      Max retries ({CAPTION_MAX_RETRIES}) reached for {chunk_path.name} after retryable error: {type(e).__name__}.")
                  break # Exit the loop, failure will be handled after the loop
 
+        except (KeyError, ValueError) as e:
+            # Bad/empty responses won't succeed on retry: fail fast
+            last_exception = e
+            print(f"      Fatal error on attempt {attempts_made} for {chunk_path.name}: {type(e).__name__} - {e}. Not retrying.")
+            break # Exit the loop immediately, failure will be handled after the loop
+
         except Exception as e:
             # These are considered non-retryable errors
             last_exception = e
@@ -611,11 +1282,8 @@ The goal is to produce a rich, detailed narrative description that captures the
         finally:
             if uploaded_file and uploaded_file.name: # Cleanup after each attempt
                 try:
-                    # print(f"      Deleting uploaded file: {uploaded_file.name} (in finally)")
-                    delete_start = time.monotonic()
-                    client.files.delete(name=uploaded_file.name)
-                    delete_end = time.monotonic()
-                    # print(f"        File deletion took {delete_end - delete_start:.2f}s")
+                    with _span("gemini.delete"):
+                        await client.aio.files.delete(name=uploaded_file.name)
                 except Exception as delete_error:
                     print(f"      WARNING: Error deleting file {uploaded_file.name} in finally block: {delete_error}")
             uploaded_file = None # Ensure reference is cleared
@@ -629,46 +1297,72 @@ The goal is to produce a rich, detailed narrative description that captures the
          print(f"    Failed to process {chunk_path.name} after {attempts_made} attempts. Reason unknown (loop finished unexpectedly).")
     return chunk_path, None # Return None for caption on failure
 
-def _generate_video_summary(openai_client, concatenated_captions):
-    """Internal helper to generate summary and themes using OpenAI."""
-    summary = f"Error: Summarization failed."
-    themes = ""
+async def _caption_all_chunks_async(client, chunk_paths):
+    """
+    Internal helper: Captions all chunks concurrently on a single asyncio event loop.
 
-    summary_prompt = f"""
-**Objective:** Generate a concise, accurate, and informative overall summary of a video based on a sequence of timed text captions derived from its chunks.
+    At most CAPTION_MAX_WORKERS chunks are in flight at once, and generate calls
+    are paced to GEMINI_REQUESTS_PER_MINUTE.
 
-**Input:** You will receive a single block of text containing concatenated captions. Each caption describes a sequential segment of the video and is preceded by its start and end timestamps (e.g., "[00:12.345 - 00:16.789]").
+    Args:
+        client: Initialized Gemini API client.
+        chunk_paths (List[Path]): Chunk files to caption.
 
-**Task:**
-1. Read through the entire sequence of timed captions to understand the video's content flow.
-2. Synthesize this information into a single, coherent paragraph summarizing the **entire video**.
-3. Focus on identifying:
-    * The main subject(s) or characters.
-    * The primary actions, events, or topics discussed.
-    * The overall narrative arc or progression (beginning, middle, end developments).
-    * The central theme, message, or purpose of the video, if discernible.
-4. The summary must be **concise** and capture the most crucial information.
-5. **Ignore minor repetitive details** mentioned across consecutive captions if they don't represent significant changes or progression. Focus on the essence of what happened.
-6. The final output should be **only the summary paragraph**, suitable for providing high-level context when answering user questions about the video. Do not include preamble or explanation.
+    Returns:
+        Tuple[dict, int, int]: Map of chunk name (no extension) -> caption (None on failure),
+        number of successful captions, number of failed captions.
+    """
+    semaphore = asyncio.Semaphore(CAPTION_MAX_WORKERS)
+    rate_limiter = AsyncTokenBucket(GEMINI_REQUESTS_PER_MINUTE / 60, CAPTION_MAX_WORKERS)
 
-**Input Captions:**
-{concatenated_captions}
+    async def _caption_with_limit(chunk_path):
+        async with semaphore:
+            try:
+                return await _process_single_chunk_for_captioning(client, chunk_path, rate_limiter)
+            except Exception as exc:
+                print(f"    Chunk {chunk_path.name} generated an exception: {exc}")
+                return chunk_path, None
+
+    tasks = [asyncio.create_task(_caption_with_limit(chunk_path)) for chunk_path in chunk_paths]
+    print(f"    Submitted {len(tasks)} chunks for captioning...")
+
+    caption_map = {} # Store results: chunk_name_no_ext -> caption
+    successful_captions = 0
+    failed_captions = 0
+    completed_count = 0
+    total_chunks = len(tasks)
+    for next_done in asyncio.as_completed(tasks):
+        chunk_path, caption = await next_done
+        completed_count += 1
+        caption_map[chunk_path.stem] = caption # Store caption (or None if failed)
+        if caption is not None:
+            successful_captions += 1
+            print(f"    Progress: {completed_count}/{total_chunks} chunks processed (Success: {chunk_path.name})")
+        else:
+            failed_captions += 1
+            print(f"    Progress: {completed_count}/{total_chunks} chunks processed (Failed: {chunk_path.name})")
 
-**Output Summary:**
-"""
-    themes_prompt = f"""
-Based on the following video captions, identify 3-5 key themes or topics covered in the video.
-Return ONLY a comma-separated list of themes/topics, with no numbering, explanations, or preamble.
+    return caption_map, successful_captions, failed_captions
 
-Example good output: "friendship, betrayal, redemption"
+def _generate_video_summary(concatenated_captions):
+    """Internal helper to generate summary and themes using OpenAI (both requests run concurrently on one AsyncOpenAI client)."""
+    summary = f"Error: Summarization failed."
+    themes = ""
 
-Captions:
-{concatenated_captions}
-"""
+    # Reuse a previously generated summary/themes for identical captions/model/prompt
+    cache_key = CaptionCache.make_key(concatenated_captions, SUMMARY_MODEL_NAME, SUMMARY_PROMPT_VERSION)
+    cached = summary_cache.get(cache_key)
+    if cached:
+        print("      Using cached summary and themes.")
+        return cached["summary"], cached["themes"]
 
-    def call_openai(prompt, max_tok, temp):
+    summary_prompt = "".join((_SUMMARY_PROMPT_PREFIX, concatenated_captions, _SUMMARY_PROMPT_SUFFIX))
+    themes_prompt = "".join((_THEMES_PROMPT_PREFIX, concatenated_captions, _THEMES_PROMPT_SUFFIX))
+
+    async def call_openai(async_client, prompt, max_tok, temp):
         try:
-            response = openai_client.chat.completions.create(
+            response = await _call_openai_with_retries_async(
+                async_client.chat.completions.create,
                 model=SUMMARY_MODEL_NAME,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=temp, max_tokens=max_tok
@@ -678,15 +1372,25 @@ Captions:
             print(f"      Error calling OpenAI for summarization/themes: {e}")
             return None
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        summary_future = executor.submit(call_openai, summary_prompt, 500, 0.5)
-        themes_future = executor.submit(call_openai, themes_prompt, 100, 0.3)
-        summary_res = summary_future.result()
-        themes_res = themes_future.result()
+    async def call_both():
+        # The client is scoped to this event loop (_run_async creates a new loop per call)
+        # max_retries=0: _call_openai_with_retries_async owns the retry policy
+        async with AsyncOpenAI(
+            api_key=OPENAI_API_KEY, http_client=_make_openai_http_client(httpx.AsyncClient), max_retries=0
+        ) as async_client:
+            return await asyncio.gather(
+                call_openai(async_client, summary_prompt, 500, 0.5),
+                call_openai(async_client, themes_prompt, 100, 0.3)
+            )
+
+    summary_res, themes_res = _run_async(call_both())
 
     if summary_res: summary = summary_res
     if themes_res: themes = themes_res
 
+    if summary_res and themes_res: # Only cache complete, successful results
+        summary_cache.put(cache_key, {"summary": summary, "themes": themes})
+
     return summary, themes
 
 def generate_captions_and_summary(metadata_json_path):
@@ -711,21 +1415,28 @@ def generate_captions_and_summary(metadata_json_path):
          print("  Error: Missing GEMINI_API_KEY or OPENAI_API_KEY. Cannot proceed.")
          return None
 
-    # Initialize clients
-    global openai_client # Use the global client if initialized
+    # Initialize clients (summary/themes use a short-lived AsyncOpenAI client, see _generate_video_summary)
     try:
-        gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-        if not openai_client:
-            openai_client = OpenAI(api_key=OPENAI_API_KEY)
-            print("  Initialized OpenAI client for summarization.")
+        # One client (and one pooled HTTP/2 async connection pool) for every caption call in this stage
+        gemini_client = genai.Client(
+            api_key=GEMINI_API_KEY,
+            http_options=google_types.HttpOptions(
+                async_client_args={
+                    "http2": True,
+                    "limits": httpx.Limits(
+                        max_connections=GEMINI_MAX_CONNECTIONS,
+                        max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS
+                    ),
+                }
+            )
+        )
     except Exception as e:
          print(f"  Error initializing API clients: {e}")
          return None
 
     # Read JSON data
     try:
-        with open(metadata_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _read_json(metadata_json_path)
     except (IOError, json.JSONDecodeError) as e:
         print(f"  Error reading or parsing JSON file {metadata_json_path}: {e}")
         return None
@@ -773,13 +1484,16 @@ def generate_captions_and_summary(metadata_json_path):
         json_chunk_map = {chunk.get('chunk_name'): chunk for chunk in data.get('chunks', []) if chunk.get('chunk_name')}
 
         # Identify chunks needing captions (missing or empty caption field)
+        # One directory read instead of a stat() per chunk
+        with os.scandir(chunks_dir) as entries:
+            existing_chunk_files = {entry.name for entry in entries if entry.is_file()}
         missing_chunk_files = []
         for chunk_name, chunk_meta in json_chunk_map.items():
             if 'caption' not in chunk_meta or not chunk_meta.get('caption'):
                 # Construct filename WITH extension for file check
                 chunk_filename_with_ext = f"{chunk_name}.mp4"
                 chunk_path = chunks_dir / chunk_filename_with_ext
-                if chunk_path.is_file():
+                if chunk_filename_with_ext in existing_chunk_files:
                     chunks_to_process.append(chunk_path)
                 else:
                     print(f"    Warning: Chunk file {chunk_filename_with_ext} listed in JSON but not found at {chunk_path}. Marking caption as null.")
@@ -794,39 +1508,9 @@ def generate_captions_and_summary(metadata_json_path):
              # Remove complex status updates here
         else:
             print(f"  Found {len(chunks_to_process)} chunks requiring captions.")
-            caption_map = {} # Store results: chunk_name_no_ext -> caption
-            future_to_chunk = {}
-
-            with ThreadPoolExecutor(max_workers=CAPTION_MAX_WORKERS) as executor:
-                for chunk_path in chunks_to_process:
-                    future = executor.submit(_process_single_chunk_for_captioning, gemini_client, chunk_path)
-                    future_to_chunk[future] = chunk_path
-
-                print(f"    Submitted {len(chunks_to_process)} chunks for captioning...")
-                successful_captions = 0
-                failed_captions = 0
-                completed_count = 0
-                total_chunks = len(chunks_to_process)
-                for future in as_completed(future_to_chunk):
-                    chunk_path = future_to_chunk[future]
-                    chunk_name_no_ext = chunk_path.stem # Get name without extension
-                    completed_count += 1
-                    try:
-                        _, caption = future.result()
-                        caption_map[chunk_name_no_ext] = caption # Store caption (or None if failed)
-                        if caption is not None:
-                            successful_captions += 1
-                            print(f"    Progress: {completed_count}/{total_chunks} chunks processed (Success: {chunk_path.name})")
-                        else:
-                            failed_captions += 1
-                            print(f"    Progress: {completed_count}/{total_chunks} chunks processed (Failed: {chunk_path.name})")
-
-                    except Exception as exc:
-                        failed_captions += 1
-                        print(f"    Chunk {chunk_path.name} generated an exception: {exc}")
-                        caption_map[chunk_name_no_ext] = None # Mark as failed
-                        print(f"    Progress: {completed_count}/{total_chunks} chunks processed (Exception: {chunk_path.name})")
-
+            caption_map, successful_captions, failed_captions = _run_async(
+                _caption_all_chunks_async(gemini_client, chunks_to_process)
+            )
 
             # Update JSON data in memory with captions
             print("    Updating JSON data with generated captions...")
@@ -869,21 +1553,27 @@ def generate_captions_and_summary(metadata_json_path):
         # ... (immediate write removed) ...
 
         # Concatenate available captions chronologically
-        concatenated_captions = ""
+        caption_parts = []
         # Sort based on the chunk_number from the updated data
-        sorted_chunks = sorted(data.get("chunks", []), key=lambda x: x.get("chunk_number", float('inf'))) # Sort Nones last
+        chunks = data.get("chunks", [])
+        chunk_numbers = [chunk.get("chunk_number", math.inf) for chunk in chunks] # Missing numbers sort last
+        if all(a <= b for a, b in zip(chunk_numbers, chunk_numbers[1:])):
+            sorted_chunks = chunks # Stage 2 writes chunks in order, so this is the common case
+        else:
+            sorted_chunks = [chunks[i] for i in sorted(range(len(chunks)), key=chunk_numbers.__getitem__)]
         captions_available_count = 0
         for chunk in sorted_chunks:
             caption = chunk.get("caption")
             if caption and isinstance(caption, str): # Only include non-empty string captions
                 start_ts = chunk.get("start_timestamp", "00:00.000")
                 end_ts = chunk.get("end_timestamp", "00:00.000")
-                concatenated_captions += f"[{start_ts} - {end_ts}]\n{caption}\n---\n"
+                caption_parts.append(f"[{start_ts} - {end_ts}]\n{caption}\n---\n")
                 captions_available_count += 1
+        concatenated_captions = "".join(caption_parts)
 
         if captions_available_count > 0:
             print(f"    Concatenated {captions_available_count} available captions for summarization.")
-            summary, themes = _generate_video_summary(openai_client, concatenated_captions)
+            summary, themes = _generate_video_summary(concatenated_captions)
             data["overall_summary"] = summary
             data["key_themes"] = themes if themes else "Error: Theme generation failed."
             data["summary_generated_at"] = datetime.now().isoformat()
@@ -911,8 +1601,7 @@ def generate_captions_and_summary(metadata_json_path):
 
     # --- Save Final JSON for Stage 3 ---
     try:
-        with open(metadata_json_path, 'w', encoding='utf-8') as f:
-             json.dump(data, f, indent=2, ensure_ascii=False)
+        _atomic_write_json(metadata_json_path, data, ensure_ascii=False)
         print(f"  Successfully saved enriched metadata to {metadata_json_path}")
         print(f"  -> Stage 3 Result: {metadata_json_path}")
         return metadata_json_path
@@ -924,7 +1613,19 @@ def generate_captions_and_summary(metadata_json_path):
 # --- Stage 4: Indexing Captions ---
 
 def initialize_clients():
-    """Initialize API clients for OpenAI and Pinecone."""
+    """Initialize API clients for OpenAI and Pinecone (once per process; later calls return immediately)."""
+    global _clients_initialized
+    if _clients_initialized:
+        return
+    with _clients_init_lock:
+        if _clients_initialized:
+            return
+        _initialize_clients_locked()
+        _clients_initialized = True
+
+
+def _initialize_clients_locked():
+    """Internal helper: Creates the OpenAI/Pinecone clients and connects to the index. Caller holds _clients_init_lock."""
     global openai_client, pc, pinecone_index, PINECONE_INDEX_HOST # Ensure global variable modification
 
     # Initialize OpenAI client (if not already done by summary stage)
@@ -933,7 +1634,9 @@ def initialize_clients():
             print("ERROR: OPENAI_API_KEY not found for client initialization.")
             raise EnvironmentError("OPENAI_API_KEY is required.")
         try:
-            openai_client = OpenAI(api_key=OPENAI_API_KEY)
+            # One pooled HTTP/2 client reused by every embedding request in the process
+            # max_retries=0: _call_openai_with_retries owns the retry policy (the SDK default would compound it)
+            openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=_make_openai_http_client(httpx.Client), max_retries=0)
             print("  Initialized OpenAI client for indexing.")
         except Exception as e:
             print(f"  Error initializing OpenAI client: {e}")
@@ -956,6 +1659,19 @@ def initialize_clients():
     else:
          print("  Pinecone client already initialized.")
 
+    # Fast path: a known host only needs a data-plane probe, skipping list_indexes/describe_index
+    if not pinecone_index and PINECONE_INDEX_HOST:
+        print(f"  Connecting to Pinecone index '{INDEX_NAME}' via cached host: {PINECONE_INDEX_HOST}")
+        try:
+            index = pc.Index(host=PINECONE_INDEX_HOST)
+            index.describe_index_stats()
+            pinecone_index = index
+            print(f"  Successfully connected to index '{INDEX_NAME}'.")
+            return
+        except Exception as e:
+            print(f"  Could not connect via cached host ({e}). Falling back to index discovery...")
+            PINECONE_INDEX_HOST = None
+
     # Handle Pinecone index host setup and connection
     if not pinecone_index:
         if not PINECONE_INDEX_HOST:
@@ -1032,8 +1748,6 @@ def initialize_clients():
             except Exception as e:
                 print(f"      Warning: Could not update {dotenv_path.name}: {e}")
                 print(f"      You may need to set PINECONE_INDEX_HOST manually in this file for future runs.")
-        else:
-            print(f"  Using existing PINECONE_INDEX_HOST from environment: {PINECONE_INDEX_HOST}")
 
         # Connect to the index
         print(f"  Connecting to Pinecone index '{INDEX_NAME}' via host: {PINECONE_INDEX_HOST}")
@@ -1049,22 +1763,134 @@ def initialize_clients():
         print("  Pinecone index connection already established.")
 
 
-def get_embedding(caption_text: str, model_name: str) -> list[float]:
-    """Helper function to get embedding for a caption text using the global client."""
+def get_embeddings_batch(texts: list[str], model_name: str) -> list[list[float]]:
+    """
+    Helper function to get embeddings for a batch of caption texts in one request using the global client.
+
+    Returns the embedding vectors in the same order as `texts`.
+    """
     global openai_client
     if not openai_client:
         raise RuntimeError("OpenAI client is not initialized. Call initialize_clients first.")
     try:
-        response = openai_client.embeddings.create(
-            input=caption_text,
+        response = _call_openai_with_retries(
+            openai_client.embeddings.create,
+            input=texts,
             model=model_name
         )
-        # print(f"    Embedding created for caption snippet: {caption_text[:50]}...")
-        return response.data[0].embedding
+        # The API returns one item per input, tagged with its input index
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
     except Exception as e:
-        print(f"    ERROR getting embedding for caption: {caption_text[:50]}... Error: {e}")
-        # Consider logging the full caption text here for debugging if needed
-        raise RuntimeError(f"Failed to get embedding for caption: {caption_text[:50]}...") from e
+        print(f"    ERROR getting embeddings for batch of {len(texts)} captions (first: {texts[0][:50]}...). Error: {e}")
+        raise RuntimeError(f"Failed to get embeddings for batch of {len(texts)} captions starting: {texts[0][:50]}...") from e
+
+def _embed_caption_batch(texts, model_name):
+    """
+    Internal helper: Embeds a batch of captions, isolating captions the API rejects outright.
+
+    If the whole batch fails with a bad-request error (e.g. an over-long or filtered
+    caption), the batch is split in halves recursively, so only the branches holding a
+    bad caption are narrowed down (about 2*log2(n) extra requests per bad caption) and
+    the rest still get embedded. Transient errors are raised to the caller unchanged.
+
+    Args:
+        texts (List[str]): Caption texts to embed.
+        model_name (str): Embedding model name.
+
+    Returns:
+        Tuple[dict, dict]: {caption: vector} for embedded captions and
+        {caption: error message} for captions the API rejected.
+    """
+    try:
+        return dict(zip(texts, get_embeddings_batch(texts, model_name))), {}
+    except RuntimeError as e:
+        if not isinstance(e.__cause__, BadRequestError):
+            raise
+        if len(texts) == 1:
+            return {}, {texts[0]: str(e.__cause__)}
+
+    middle = len(texts) // 2
+    embedded, rejected = _embed_caption_batch(texts[:middle], model_name)
+    right_embedded, right_rejected = _embed_caption_batch(texts[middle:], model_name)
+    embedded.update(right_embedded)
+    rejected.update(right_rejected)
+    return embedded, rejected
+
+def _prepare_upsert_vectors(chunks, embeddings, video_id):
+    """
+    Internal helper: Builds Pinecone upsert records for chunks whose caption has an embedding.
+
+    Args:
+        chunks (List[dict]): Chunk metadata dicts with "chunk_name" and "caption".
+        embeddings (dict): Map of caption text -> embedding vector.
+        video_id (str): Video ID stored in each record's metadata.
+
+    Returns:
+        Tuple[List[dict], int]: Upsert records, and the number of chunks skipped for a missing embedding.
+    """
+    # Chunks with a caption but no embedding (failed or missing) are skipped and counted
+    embedding_lookup_failures = 0
+    for chunk in chunks:
+        caption = chunk.get("caption")
+        if caption and caption not in embeddings:
+            print(f"    Warning: Embedding not found for chunk '{chunk.get('chunk_name')}'. Skipping upsert.")
+            embedding_lookup_failures += 1
+
+    # One metadata dict per chunk, built already filtered (Pinecone rejects null metadata values).
+    # Only fields the backend's retrieval reads are stored: the chunk name is already the vector ID,
+    # and the chunk duration stays in the metadata JSON.
+    # chunk_name/caption/vector are bound once per chunk and reused below; the lookup method is hoisted.
+    lookup = embeddings.get
+    vectors_to_upsert = [
+        {
+            "id": chunk_name, # Use extension-less name as Pinecone ID
+            "values": vector,
+            "metadata": {key: value for key, value in (
+                ("caption", caption),
+                ("start_timestamp", chunk.get("start_timestamp", "Unknown")),
+                ("end_timestamp", chunk.get("end_timestamp", "Unknown")),
+                ("video_id", video_id),
+                ("normalized_start_time", chunk.get("normalized_start_time")),
+                ("normalized_end_time", chunk.get("normalized_end_time")),
+                ("chunk_number", chunk.get("chunk_number")),
+            ) if value is not None},
+        }
+        for chunk in chunks
+        if (chunk_name := chunk.get("chunk_name")) and (vector := lookup(caption := chunk.get("caption"))) is not None
+    ]
+    return vectors_to_upsert, embedding_lookup_failures
+
+def _build_upsert_batches(vectors):
+    """
+    Internal helper: Splits vectors into upsert batches bounded by count and estimated payload size.
+
+    Each batch holds at most INDEXING_BATCH_SIZE vectors and stays under
+    INDEXING_MAX_REQUEST_BYTES, estimated from the gRPC (protobuf) size of the values
+    plus the serialized metadata and a fixed per-record overhead.
+
+    Args:
+        vectors (List[dict]): Upsert records with "id", "values" and "metadata".
+
+    Returns:
+        List[List[dict]]: Batches in the original order.
+    """
+    batches = []
+    current_batch = []
+    current_bytes = 0
+    for vector in vectors:
+        vector_bytes = (
+            len(vector["values"]) * INDEXING_BYTES_PER_VALUE + _json_size(vector["metadata"])
+            + len(vector["id"]) + INDEXING_RECORD_OVERHEAD_BYTES
+        )
+        if current_batch and (len(current_batch) >= INDEXING_BATCH_SIZE or current_bytes + vector_bytes > INDEXING_MAX_REQUEST_BYTES):
+            batches.append(current_batch)
+            current_batch = []
+            current_bytes = 0
+        current_batch.append(vector)
+        current_bytes += vector_bytes
+    if current_batch:
+        batches.append(current_batch)
+    return batches
 
 def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
     """
@@ -1084,32 +1910,38 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
 
     global openai_client, pc, pinecone_index # Use global clients
 
-    # Initialize clients if not already done
-    try:
-        initialize_clients()
-    except Exception as e:
-        print(f"  Failed to initialize API clients: {e}")
-        # Remove status update here
-        # try: ... data["processing_status"] = "INDEXING_FAILED_CLIENT_INIT" ...
-        return None
-
-    if not openai_client or not pc or not pinecone_index:
-        print("  Error: API clients could not be initialized or connected.")
-        # Remove status update here
-        # try: ... data["processing_status"] = "INDEXING_FAILED_CLIENT_CONNECT" ...
-        return None
-
     json_file_path = Path(enriched_metadata_json_path)
     start_time = time.time()
 
     # Load JSON data
     try:
-        with open(json_file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _read_json(json_file_path)
     except (json.JSONDecodeError, IOError) as e:
         print(f"  Error reading/decoding JSON {json_file_path}: {e}")
         return None
 
+    # Fully processed on an earlier run: no clients, no Pinecone calls and no JSON write needed
+    if data.get("indexing_status") in INDEXING_DONE_STATUSES and data.get("processing_status") == "FINISHED":
+        print(f"  {json_file_path.name} is already indexed ({data['indexing_status']}) and FINISHED. Skipping Stage 4.")
+        print(f"  -> Stage 4 Result: {enriched_metadata_json_path}")
+        return enriched_metadata_json_path
+
+    # Initialize clients if not already done (not needed when indexing already finished)
+    if data.get("indexing_status") not in INDEXING_DONE_STATUSES:
+        try:
+            initialize_clients()
+        except Exception as e:
+            print(f"  Failed to initialize API clients: {e}")
+            # Remove status update here
+            # try: ... data["processing_status"] = "INDEXING_FAILED_CLIENT_INIT" ...
+            return None
+
+        if not openai_client or not pc or not pinecone_index:
+            print("  Error: API clients could not be initialized or connected.")
+            # Remove status update here
+            # try: ... data["processing_status"] = "INDEXING_FAILED_CLIENT_CONNECT" ...
+            return None
+
     # Remove overall status update here
     # final_caption_summary_status = data.get("processing_status", "") # No longer needed
 
@@ -1126,29 +1958,23 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
     else:
         # Proceed with indexing logic only if not already completed/skipped
 
-        # Set indexing_status to IN_PROGRESS
-        data["indexing_status"] = "IN_PROGRESS"
-        try: # Write status update immediately
-            with open(json_file_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-        except Exception as e: print(f"  Warning: Failed to update JSON status for indexing start: {e}")
+        # Set indexing_status to IN_PROGRESS (buffered; flushed after the existing-ID fetch or on failure)
+        status_writer = StatusWriter(json_file_path, data, "indexing_status", ensure_ascii=False)
+        status_writer.set("IN_PROGRESS")
 
         # Extract required data (video_id, chunks)
         video_id = data.get("video_id")
         if not video_id:
             print(f"  Error: No valid 'video_id' found in {json_file_path}.")
-            data["indexing_status"] = "FAILED_NO_VIDEO_ID"
-            try:
-                with open(json_file_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-            except Exception as e: print(f"  Warning: Failed to update JSON status: {e}")
+            status_writer.set("FAILED_NO_VIDEO_ID")
+            status_writer.checkpoint()
             return None # Critical error, stop pipeline
 
         chunks = data.get("chunks") or []
         if not isinstance(chunks, list):
             print(f"  Error: No valid 'chunks' list found in {json_file_path}.")
-            data["indexing_status"] = "FAILED_NO_CHUNKS"
-            try:
-                with open(json_file_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-            except Exception as e: print(f"  Warning: Failed to update JSON status: {e}")
+            status_writer.set("FAILED_NO_CHUNKS")
+            status_writer.checkpoint()
             return None # Critical error, stop pipeline
 
         print(f"  Loaded {len(chunks)} chunks from {json_file_path.name} for video_id: {video_id}")
@@ -1157,8 +1983,7 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
         chunks_with_captions = [chunk for chunk in chunks if chunk.get("caption") and isinstance(chunk.get("caption"), str) and chunk.get("chunk_name")]
         if not chunks_with_captions:
             print("  No chunks with valid captions found to index. Skipping Pinecone operations.")
-            data["indexing_status"] = "SKIPPED_NO_CAPTIONS" # Update specific status
-            data["indexing_completed_at"] = datetime.now().isoformat()
+            status_writer.set("SKIPPED_NO_CAPTIONS", indexing_completed_at=datetime.now().isoformat())
             # Proceed to final update section to mark overall as FINISHED
         else:
             # Determine new vectors to process by checking existing IDs in Pinecone
@@ -1173,41 +1998,50 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
             else:
                 print(f"  Checking existence of {len(potential_ids)} potential IDs in Pinecone for video_id '{video_id}'...")
                 ids_to_fetch = list(potential_ids)
-                try:
-                    # Batch fetching if necessary (Pinecone fetch limit is 1000)
-                    fetched_vectors = {}
-                    fetch_batch_size = 1000
-                    for i in range(0, len(ids_to_fetch), fetch_batch_size):
-                         batch_ids = ids_to_fetch[i:i + fetch_batch_size]
-                         print(f"    Fetching batch {i // fetch_batch_size + 1}...")
-                         fetch_start = time.time()
-                         fetch_response = pinecone_index.fetch(ids=batch_ids)
-                         fetch_end = time.time()
-                         fetched_vectors.update(fetch_response.vectors)
-                         print(f"      Batch fetch took: {fetch_end - fetch_start:.4f} seconds, got {len(fetch_response.vectors)} vectors.")
-
-
-                    existing_ids = set(fetched_vectors.keys())
-                    count_of_existing_ids = len(existing_ids)
-                    # Correct calculation for new IDs
-                    # count_of_new_ids = len(potential_ids) - count_of_existing_ids
-                    chunks_to_process = [chunk for chunk in chunks_with_captions if chunk["chunk_name"] not in existing_ids]
-                    count_of_new_ids = len(chunks_to_process) # Count of chunks *not* found
-
-                    print(f"    Found {count_of_existing_ids} existing IDs among the potential {len(potential_ids)} for this video.")
-                    print(f"    Expecting to add {count_of_new_ids} new vectors.")
-
-                    # chunks_to_process = [chunk for chunk in chunks_with_captions if chunk["chunk_name"] not in existing_ids] # Already done above
-                    print(f"    Identified {len(chunks_to_process)} new chunks with captions to process and index.")
-
-                except Exception as e:
+                # Batch fetching if necessary (Pinecone fetch limit is 1000); batches are fetched concurrently
+                fetch_batch_size = INDEXING_FETCH_BATCH_SIZE
+                fetch_errors = []
+                fetch_start = time.time()
+                with concurrent.futures.ThreadPoolExecutor(max_workers=INDEXING_MAX_FETCH_WORKERS) as executor:
+                    future_to_batch_num = {
+                        executor.submit(pinecone_index.fetch, ids=ids_to_fetch[i:i + fetch_batch_size]): i // fetch_batch_size + 1
+                        for i in range(0, len(ids_to_fetch), fetch_batch_size)
+                    }
+                    print(f"    Fetching {len(future_to_batch_num)} batch(es)...")
+                    for future in concurrent.futures.as_completed(future_to_batch_num):
+                        batch_num = future_to_batch_num[future]
+                        try:
+                            fetched = future.result().vectors
+                        except Exception as e:
+                            # IDs from a failed batch never reach existing_ids, so only those chunks are re-processed
+                            fetch_errors.append(f"batch {batch_num}: {e}")
+                            print(f"      Warning: Batch {batch_num} fetch failed: {e}")
+                            continue
+                        existing_ids.update(fetched.keys()) # Only IDs are needed; vector values are not retained
+                fetch_end = time.time()
+                print(f"      Fetching existing IDs took: {fetch_end - fetch_start:.4f} seconds.")
+
+                if fetch_errors:
                     fetch_failed = True
-                    print(f"  Warning: Could not fetch existing IDs from Pinecone: {e}")
-                    print("    Proceeding assuming all chunks with captions might be new (will attempt upsert).")
-                    chunks_to_process = chunks_with_captions
-                    count_of_new_ids = len(chunks_to_process)
-                    data["indexing_warnings"] = data.get("indexing_warnings", "") + f"Failed to fetch existing IDs: {e};"
-
+                    print(f"  Warning: Could not fetch existing IDs for {len(fetch_errors)} batch(es).")
+                    print("    Chunks in those batches are treated as new (upsert overwrites any existing vectors).")
+                    data["indexing_warnings"] = data.get("indexing_warnings", "") + f"Failed to fetch existing IDs: {'; '.join(fetch_errors)};"
+
+                count_of_existing_ids = len(existing_ids)
+                chunks_to_process = [chunk for chunk in chunks_with_captions if chunk["chunk_name"] not in existing_ids]
+                count_of_new_ids = len(chunks_to_process) # Count of chunks *not* found
+
+                print(f"    Found {count_of_existing_ids} existing IDs among the potential {len(potential_ids)} for this video.")
+                print(f"    Expecting to add {count_of_new_ids} new vectors.")
+                print(f"    Identified {len(chunks_to_process)} new chunks with captions to process and index.")
+
+            if not chunks_to_process:
+                # Everything is already indexed: no executors, no IN_PROGRESS checkpoint
+                print("  All chunks with captions are already indexed. Skipping embedding and upsert.")
+                status_writer.set("SKIPPED_ALREADY_INDEXED", indexing_completed_at=datetime.now().isoformat())
+            else:
+                # Single mid-stage checkpoint: record IN_PROGRESS before the long embed/upsert phase
+                status_writer.checkpoint()
 
             # Process and index new chunks
             total_upserted_count = 0
@@ -1217,121 +2051,133 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
 
             if chunks_to_process:
                 print(f"\n  Processing {len(chunks_to_process)} new chunks for indexing...")
-                vectors_to_upsert = []
 
                 start_embedding_time = time.time()
-                captions_to_embed = [chunk['caption'] for chunk in chunks_to_process]
+                # Identical captions share one embedding; chunks are grouped by caption so each embedded
+                # caption can be fanned back out to every chunk that uses it
+                chunks_by_caption = defaultdict(list)
+                for chunk in chunks_to_process:
+                    chunks_by_caption[chunk['caption']].append(chunk)
+                captions_to_embed = list(chunks_by_caption) # First-seen order
                 embeddings = {} # Map: {caption_text: embedding_vector}
 
-                print(f"    Requesting embeddings for {len(captions_to_embed)} captions...")
+                # Serve previously embedded captions from the local cache; only misses go to the API
+                caption_keys = {caption: EmbeddingCache.make_key(EMBED_MODEL_NAME, caption) for caption in captions_to_embed}
+                cached_vectors = embedding_cache.get_many(list(caption_keys.values()))
+                for caption, key in caption_keys.items():
+                    if key in cached_vectors:
+                        embeddings[caption] = cached_vectors[key]
+                if embeddings:
+                    print(f"    Loaded {len(embeddings)} embeddings from the local cache.")
+                    captions_to_embed = [caption for caption in captions_to_embed if caption not in embeddings]
+
+                # Captions the API permanently rejected on an earlier run are skipped instead of retried
+                embedding_lookup_failures = 0
+                rejected_keys = embedding_cache.get_rejected([caption_keys[caption] for caption in captions_to_embed])
+                if rejected_keys:
+                    skipped_captions = [caption for caption in captions_to_embed if caption_keys[caption] in rejected_keys]
+                    embedding_lookup_failures += sum(len(chunks_by_caption[caption]) for caption in skipped_captions)
+                    print(f"    Skipping {len(skipped_captions)} captions the embeddings API rejected on an earlier run.")
+                    # Still a failure for this run's status: these chunks are not in the index
+                    indexing_errors.append(f"Skipped {len(skipped_captions)} caption(s) rejected by the embeddings API on an earlier run, starting: {skipped_captions[0][:50]}")
+                    embedding_failed = True
+                    captions_to_embed = [caption for caption in captions_to_embed if caption_keys[caption] not in rejected_keys]
+                newly_rejected = {} # Map: {caption_text: error message}
+
+                # Embedding and upserting overlap: vectors for each caption batch are upserted as soon as
+                # its embeddings arrive (cached captions are ready immediately), while later batches are still embedding
+                caption_batches = [captions_to_embed[i:i + EMBED_BATCH_SIZE] for i in range(0, len(captions_to_embed), EMBED_BATCH_SIZE)]
+                if caption_batches:
+                    print(f"    Requesting embeddings for {len(captions_to_embed)} captions in {len(caption_batches)} batch(es), upserting as they arrive...")
+                else:
+                    print("    All embeddings are cached; no embedding requests needed.")
+                vectors_submitted = 0
+                upsert_future_to_batch = {} # Map: {future: (batch_num, batch_vectors)}
                 try:
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=INDEXING_MAX_EMBEDDING_WORKERS) as executor:
-                        future_to_caption = {executor.submit(get_embedding, caption, EMBED_MODEL_NAME): caption for caption in captions_to_embed}
-                        results_count = 0 # Added for progress
-                        total_to_embed = len(future_to_caption) # Added for progress
-                        for future in concurrent.futures.as_completed(future_to_caption):
-                            caption_text = future_to_caption[future]
-                            results_count += 1 # Added for progress
+                    with contextlib.ExitStack() as pools:
+                        upsert_executor = pools.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=INDEXING_MAX_UPSERT_WORKERS))
+                        future_to_batch = {}
+                        if caption_batches: # The embedding pool is only created when there are cache misses
+                            embed_executor = pools.enter_context(concurrent.futures.ThreadPoolExecutor(
+                                max_workers=min(INDEXING_MAX_EMBEDDING_WORKERS, len(caption_batches))
+                            ))
+                            future_to_batch = {embed_executor.submit(_embed_caption_batch, batch, EMBED_MODEL_NAME): batch for batch in caption_batches}
+                        completed_embeddings = concurrent.futures.as_completed(future_to_batch)
+                        ready_caption_batches = [list(embeddings)] if embeddings else []
+                        while True:
+                            # Prepare and submit upserts for every caption batch whose embeddings are available
+                            for caption_batch in ready_caption_batches:
+                                ready_chunks = [chunk for caption in caption_batch for chunk in chunks_by_caption[caption]]
+                                vectors, lookup_failures = _prepare_upsert_vectors(ready_chunks, embeddings, video_id)
+                                embedding_lookup_failures += lookup_failures
+                                for batch_vectors in _build_upsert_batches(vectors):
+                                    future = upsert_executor.submit(pinecone_index.upsert, vectors=batch_vectors)
+                                    upsert_future_to_batch[future] = (len(upsert_future_to_batch) + 1, batch_vectors)
+                                    vectors_submitted += len(batch_vectors)
+                            ready_caption_batches = []
+
+                            future = next(completed_embeddings, None)
+                            if future is None:
+                                break
+                            caption_batch = future_to_batch[future]
                             try:
-                                embedding_vector = future.result()
-                                embeddings[caption_text] = embedding_vector # Store result in map
-                                # print(f"      Embedding progress: {results_count}/{total_to_embed} ({caption_text[:30]}...)") # Optional verbose log
+                                embedded, rejected = future.result()
                             except Exception as exc:
-                                print(f"      ERROR processing caption embedding: {caption_text[:50]}... Exception: {exc}")
-                                indexing_errors.append(f"Embedding failed for caption starting: {caption_text[:50]}")
-                                embedding_failed = True # Mark failure, but continue processing others
-                                # Optionally store the failed caption to mark in JSON later?
-                            print(f"    Retrieved {len(embeddings)} embeddings (may include failures).")
+                                print(f"      ERROR processing embedding batch of {len(caption_batch)} captions (first: {caption_batch[0][:50]}...). Exception: {exc}")
+                                indexing_errors.append(f"Embedding failed for batch of {len(caption_batch)} captions starting: {caption_batch[0][:50]}")
+                                embedding_failed = True # Mark failure, but continue processing other batches
+                                # Chunks in a failed batch have no embedding and are skipped
+                                embedding_lookup_failures += sum(len(chunks_by_caption[caption]) for caption in caption_batch)
+                                continue
+                            embeddings.update(embedded) # Store results in map
+                            ready_caption_batches.append(list(embedded))
+                            if rejected:
+                                print(f"      The embeddings API rejected {len(rejected)} caption(s); they will be skipped on later runs.")
+                                indexing_errors.append(f"Embeddings API rejected {len(rejected)} caption(s) starting: {next(iter(rejected))[:50]}")
+                                embedding_failed = True
+                                embedding_lookup_failures += sum(len(chunks_by_caption[caption]) for caption in rejected)
+                                newly_rejected.update(rejected)
+
+                        print(f"    Retrieved {len(embeddings)} embeddings (cached + new).")
+                        embedding_complete_time = time.time()
+                        print(f"    Embedding took: {embedding_complete_time - start_embedding_time:.4f} seconds.")
+
+                        # Collect upsert results; a failed batch is recorded and the remaining batches still complete
+                        for future in concurrent.futures.as_completed(upsert_future_to_batch):
+                            batch_num, batch_vectors = upsert_future_to_batch[future]
+                            try:
+                                upserted_in_batch = future.result().upserted_count
+                                total_upserted_count += upserted_in_batch or 0 # Handle None case
+                                batch_len = len(batch_vectors)
+                                if upserted_in_batch != batch_len:
+                                     print(f"        WARNING: Upsert count mismatch in batch {batch_num}. Expected {batch_len}, got {upserted_in_batch}.")
+                                     indexing_errors.append(f"Upsert count mismatch in batch {batch_num}")
+                                     upsert_failed = True # Mark as partial failure
+                            except Exception as e:
+                                print(f"      Error upserting batch {batch_num} to Pinecone: {e}")
+                                indexing_errors.append(f"Upsert failed for batch {batch_num}: {e}")
+                                upsert_failed = True
 
                 except Exception as e: # Catch errors during thread pool setup/management
-                    print(f"  An error occurred during concurrent embedding setup: {e}")
+                    print(f"  An error occurred during concurrent embedding/upsert: {e}")
                     embedding_failed = True
-                    indexing_errors.append(f"Embedding thread pool error: {e}")
+                    indexing_errors.append(f"Embedding/upsert thread pool error: {e}")
 
-                embedding_complete_time = time.time()
-                print(f"    Concurrent embedding took: {embedding_complete_time - start_embedding_time:.4f} seconds.")
+                # Persist newly retrieved embeddings in one transaction
+                embedding_cache.put_many(
+                    EMBED_MODEL_NAME,
+                    [(caption_keys[caption], embeddings[caption]) for caption in captions_to_embed if caption in embeddings]
+                )
+                embedding_cache.put_rejected(EMBED_MODEL_NAME, [(caption_keys[caption], error) for caption, error in newly_rejected.items()])
 
                 if embedding_failed:
                      print("    One or more embedding tasks failed. Proceeding with successful embeddings.")
-                     # Remove status update here: data["indexing_status"] = "IN_PROGRESS_EMBEDDING_ERRORS"
-
-                # Prepare vectors for upsert, skipping those without embeddings
-                print("    Preparing vectors for Pinecone upsert...")
-                prepare_start_time = time.time()
-                vectors_to_upsert = []
-                embedding_lookup_failures = 0
-                for chunk in chunks_to_process:
-                    chunk_name = chunk.get("chunk_name") # Extension-less ID
-                    caption = chunk.get("caption")
-                    vector = embeddings.get(caption) # Look up using the caption text
-
-                    if vector is None:
-                         # This chunk's embedding failed or was missing
-                         if caption: # Only log if caption existed
-                             print(f"    Warning: Embedding not found for chunk '{chunk_name}'. Skipping upsert.")
-                             embedding_lookup_failures += 1
-                         continue
-
-                    if not chunk_name: continue # Should not happen
-
-                    # Prepare metadata for Pinecone
-                    metadata = {
-                        "caption": caption,
-                        "start_timestamp": chunk.get("start_timestamp", "Unknown"),
-                        "end_timestamp": chunk.get("end_timestamp", "Unknown"),
-                        "chunk_name": chunk_name, # Store the extension-less name
-                        "video_id": video_id,
-                        "normalized_start_time": chunk.get("normalized_start_time"),
-                        "normalized_end_time": chunk.get("normalized_end_time"),
-                        "chunk_duration_seconds": chunk.get("chunk_duration_seconds"),
-                        "chunk_number": chunk.get("chunk_number")
-                    }
-                    metadata = {k: v for k, v in metadata.items() if v is not None}
-
-                    vectors_to_upsert.append({
-                        "id": chunk_name, # Use extension-less name as Pinecone ID
-                        "values": vector,
-                        "metadata": metadata
-                    })
-
-                prepare_end_time = time.time()
-                print(f"      Vector preparation took: {prepare_end_time - prepare_start_time:.4f} seconds.")
                 if embedding_lookup_failures > 0:
                      print(f"      Skipped {embedding_lookup_failures} vectors due to missing embeddings.")
                      data["indexing_warnings"] = data.get("indexing_warnings", "") + f"{embedding_lookup_failures} chunks skipped due to embedding errors;"
 
-                # Upsert batches
-                if vectors_to_upsert:
-                     upsert_batch_start_time = time.time()
-                     num_batches = math.ceil(len(vectors_to_upsert) / INDEXING_BATCH_SIZE)
-                     print(f"    Starting upsert of {len(vectors_to_upsert)} vectors in {num_batches} batches...")
-
-                     for i in range(0, len(vectors_to_upsert), INDEXING_BATCH_SIZE):
-                         batch_num = (i // INDEXING_BATCH_SIZE) + 1
-                         batch_vectors = vectors_to_upsert[i : i + INDEXING_BATCH_SIZE]
-                         if not batch_vectors: continue
-
-                         print(f"      Upserting batch {batch_num}/{num_batches} ({len(batch_vectors)} vectors)...")
-                         try:
-                             start_upsert_batch = time.time()
-                             upsert_response = pinecone_index.upsert(vectors=batch_vectors)
-                             end_upsert_batch = time.time()
-                             batch_duration = end_upsert_batch - start_upsert_batch # Define batch_duration
-                             upserted_in_batch = upsert_response.upserted_count
-                             total_upserted_count += upserted_in_batch or 0 # Handle None case
-                             print(f"        Batch {batch_num} upsert took: {batch_duration:.4f} seconds. Upserted: {upserted_in_batch} vectors.")
-                             if upserted_in_batch != len(batch_vectors):
-                                  print(f"        WARNING: Upsert count mismatch in batch {batch_num}. Expected {len(batch_vectors)}, got {upserted_in_batch}.")
-                                  indexing_errors.append(f"Upsert count mismatch in batch {batch_num}")
-                                  upsert_failed = True # Mark as partial failure
-                         except Exception as e:
-                             print(f"      Error upserting batch {batch_num} to Pinecone: {e}")
-                             indexing_errors.append(f"Upsert failed for batch {batch_num}: {e}")
-                             upsert_failed = True # Mark failure, but continue to next batch? Or stop? Let's stop for now.
-                             break # Stop upserting if a batch fails
-
-                     upsert_batch_end_time = time.time()
-                     print(f"    Finished upserting. Total upserted in this run: {total_upserted_count} vectors in {upsert_batch_end_time - upsert_batch_start_time:.4f} seconds.")
+                if vectors_submitted:
+                     print(f"    Finished upserting. Total upserted in this run: {total_upserted_count} of {vectors_submitted} vectors ({len(upsert_future_to_batch)} batches) in {time.time() - start_embedding_time:.4f} seconds (embedding included).")
                      data["vectors_indexed_count"] = data.get("vectors_indexed_count", 0) + total_upserted_count
                 else:
                     print("    No vectors prepared for upsert (likely due to embedding failures or no new chunks).")
@@ -1339,50 +2185,19 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
 
                 # Update specific indexing status based on outcomes
                 if upsert_failed or embedding_failed or fetch_failed:
-                    data["indexing_status"] = "COMPLETED_WITH_ERRORS"
-                    data["indexing_errors"] = indexing_errors
+                    status_writer.set("COMPLETED_WITH_ERRORS", indexing_errors=indexing_errors)
                 else:
-                     # If no errors occurred during this run
-                     if chunks_to_process or fetch_failed: # If we attempted processing or fetch failed
-                         data["indexing_status"] = "COMPLETED"
-                     else: # If fetch succeeded and chunks_to_process was empty
-                         data["indexing_status"] = "SKIPPED_ALREADY_INDEXED"
-
-                data["indexing_completed_at"] = datetime.now().isoformat()
+                    status_writer.set("COMPLETED") # No errors occurred during this run
+                status_writer.update(indexing_completed_at=datetime.now().isoformat())
 
         # --- Final Update Section for Stage 4 ---
         # This section is reached if indexing completed, was skipped, or finished with errors
         print(f"  Attempting final update for {json_file_path.name}...")
-        try:
-            # Re-read data just in case it was modified by another process (though unlikely here)
-            # Or just use the 'data' dictionary we've been modifying
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                current_data = json.load(f)
-
-            # Update the main processing_status to FINISHED
-            current_data["processing_status"] = "FINISHED"
-
-            # Merge any specific indexing status updates we determined above
-            if "indexing_status" in data: # If indexing logic ran and set a status
-                current_data["indexing_status"] = data["indexing_status"]
-            if "indexing_completed_at" in data:
-                current_data["indexing_completed_at"] = data["indexing_completed_at"]
-            if "indexing_errors" in data:
-                current_data["indexing_errors"] = data["indexing_errors"]
-            if "indexing_warnings" in data:
-                 current_data["indexing_warnings"] = data.get("indexing_warnings","") + data["indexing_warnings"] # Append warnings
-            if "vectors_indexed_count" in data:
-                current_data["vectors_indexed_count"] = data["vectors_indexed_count"]
-
-
-            # Write the final updates
-            with open(json_file_path, "w", encoding="utf-8") as f:
-                 json.dump(current_data, f, indent=2, ensure_ascii=False)
-            print(f"  Successfully updated final status to 'FINISHED' in {json_file_path.name}")
-
-        except Exception as e:
-            print(f"  Warning: Could not update JSON file {json_file_path.name} with final status: {e}")
+        # The writer's dict already holds every indexing update from this run, so one flush persists them all
+        status_writer.update(processing_status="FINISHED")
+        if not status_writer.checkpoint():
             return None # Indicate JSON write failure
+        print(f"  Successfully updated final status to 'FINISHED' in {json_file_path.name}")
 
 
         end_time = time.time()
@@ -1394,6 +2209,8 @@ def index_captions_in_pinecone(enriched_metadata_json_path: str) -> str | None:
 def main_pipeline(tiktok_url): # Changed to accept URL directly
     """Runs the main technical pipeline for a given TikTok URL."""
     pipeline_start_time = time.monotonic()
+    if PIPELINE_PROFILE:
+        _SPANS.set(defaultdict(list))
     print("--- Starting Technical Pipeline ---")
     print(f"Original Input URL: {tiktok_url}")
 
@@ -1474,12 +2291,13 @@ def main_pipeline(tiktok_url): # Changed to accept URL directly
     pipeline_end_time = time.monotonic()
     elapsed_time = pipeline_end_time - pipeline_start_time
     print(f"\n--- Technical Pipeline finished in {elapsed_time:.2f} seconds ---")
+    if _SPANS.get():
+        _report_spans(_SPANS.get())
     if final_json_path_after_indexing:
          print(f"Final JSON artifact: {final_json_path_after_indexing}")
          # You might want to print the final status from the JSON here
          try:
-             with open(final_json_path_after_indexing, 'r') as f:
-                 final_data = json.load(f)
+             final_data = _read_json(final_json_path_after_indexing)
              print(f"  Final Processing Status: {final_data.get('processing_status', 'N/A')}")
              print(f"  Final Indexing Status: {final_data.get('indexing_status', 'N/A')}")
          except Exception as e: